@@ -2,8 +2,8 @@ import sys
 
 from zlib_ng import gzip_ng
 
+buffer = bytearray(128 * 1024)
 with gzip_ng.open(sys.argv[1], "rb") as gzip_file:
     while True:
-        block = gzip_file.read(128 * 1024)
-        if not block:
+        if not gzip_file.readinto(buffer):
             break
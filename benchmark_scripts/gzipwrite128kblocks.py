@@ -3,10 +3,12 @@ import sys
 
 from zlib_ng import gzip_ng
 
-with open(sys.argv[1], "rb") as in_file:
+buffer = bytearray(128 * 1024)
+view = memoryview(buffer)
+with open(sys.argv[1], "rb", buffering=0) as in_file:
     with gzip_ng.open(os.devnull, "wb") as out_gzip:
         while True:
-            block = in_file.read(128 * 1024)
-            if block == b"":
+            read_bytes = in_file.readinto(buffer)
+            if not read_bytes:
                 break
-            out_gzip.write(block)
+            out_gzip.write(view[:read_bytes])
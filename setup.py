@@ -7,10 +7,12 @@
 
 import functools
 import os
+import platform
 import shutil
 import subprocess
 import sys
 import tempfile
+import warnings
 from pathlib import Path
 
 from setuptools import Extension, find_packages, setup
@@ -32,6 +34,12 @@ DEFAULT_CACHE_FILE = Path(tempfile.gettempdir()
 BUILD_CACHE = os.environ.get("PYTHON_ZLIB_NG_BUILD_CACHE")
 BUILD_CACHE_FILE = Path(os.environ.get("PYTHON_ZLIB_NG_BUILD_CACHE_FILE",
                                        DEFAULT_CACHE_FILE))
+# Compile zlib-ng for the instruction set of the build machine. The resulting
+# binaries are faster but not portable to other machines.
+BUILD_NATIVE = os.environ.get("PYTHON_ZLIB_NG_NATIVE")
+# Link time optimization and profile guided optimization of zlib-ng.
+BUILD_LTO = os.environ.get("PYTHON_ZLIB_NG_LTO")
+BUILD_PGO = os.environ.get("PYTHON_ZLIB_NG_PGO")
 
 EXTENSIONS = [
         Extension("zlib_ng.zlib_ng", ["src/zlib_ng/zlib_ngmodule.c"]),
@@ -75,6 +83,11 @@ class BuildZlibNGExt(build_ext):
                 raise NotImplementedError(
                     f"Unsupported platform: {sys.platform}")
             ext.include_dirs = [build_dir]
+            if BUILD_LTO and sys.platform in ("darwin", "linux"):
+                # The extension must be linked with -flto as well, otherwise
+                # the link time optimization does not take place.
+                ext.extra_compile_args = ["-flto"]
+                ext.extra_link_args = ["-flto"]
             # -fPIC needed for proper static linking
             # ext.extra_compile_args = ["-fPIC"]
             pass
@@ -104,16 +117,42 @@ def build_zlib_ng():
     build_env = os.environ.copy()
     build_env["CFLAGS"] = build_env.get("CFLAGS", "") + " -fPIC"
     # Add -fPIC flag to allow static compilation
+    cmake_args = []
+    if BUILD_NATIVE:
+        if sys.platform == "darwin" and platform.machine() == "arm64":
+            # Older Apple clang versions reject -march=native on arm64.
+            build_env["CFLAGS"] += " -mcpu=native"
+        elif sys.platform in ("darwin", "linux"):
+            build_env["CFLAGS"] += " -march=native"
+        elif SYSTEM_IS_WINDOWS:
+            # zlib-ng only implements WITH_NATIVE_INSTRUCTIONS for GCC and
+            # Clang, not for MSVC.
+            warnings.warn("PYTHON_ZLIB_NG_NATIVE has no effect on Windows.")
+        else:
+            cmake_args.append("-DWITH_NATIVE_INSTRUCTIONS=ON")
+    if BUILD_LTO:
+        if sys.platform in ("darwin", "linux"):
+            build_env["CFLAGS"] += " -flto"
+        else:
+            # zlib-ng's CMake build turns interprocedural optimization off
+            # unless native instructions are used, and the extension is not
+            # linked with link time optimization on other platforms.
+            warnings.warn("PYTHON_ZLIB_NG_LTO only has an effect on Linux "
+                          "and MacOS.")
+    if BUILD_PGO and sys.platform != "linux":
+        warnings.warn("PYTHON_ZLIB_NG_PGO only has an effect on Linux.")
     run_args = dict(cwd=build_dir, env=build_env)
     if sys.platform == "darwin":  # Cmake does not work properly
         subprocess.run([os.path.join(build_dir, "configure")], **run_args)
         make_program = "gmake" if shutil.which("gmake") else "make"
         subprocess.run([make_program, "libz-ng.a"], **run_args)
     elif sys.platform == "linux":
+        if BUILD_PGO:
+            profile_zlib_ng(build_dir, build_env, cpu_count)
         subprocess.run([os.path.join(build_dir, "configure")], **run_args)
         subprocess.run(["make", "libz-ng.a", "-j", str(cpu_count)], **run_args)
     else:
-        subprocess.run(["cmake", build_dir], **run_args)
+        subprocess.run(["cmake", build_dir, *cmake_args], **run_args)
         # Do not create test suite and do not perform tests to shorten build times.
         # There is no need when stable releases of zlib-ng are used.
         subprocess.run(["cmake", "--build", build_dir, "--config", "Release",
@@ -124,6 +163,35 @@ def build_zlib_ng():
     return build_dir
 
 
+def profile_zlib_ng(build_dir, build_env, cpu_count):
+    """
+    Build zlib-ng's minigzip program with instrumentation and use it to
+    compress and decompress the zlib-ng sources. The recorded profile is used
+    by the next build when -fprofile-use is added to the build environment's
+    CFLAGS.
+    """
+    profile_env = build_env.copy()
+    profile_env["CFLAGS"] += " -fprofile-generate"
+    profile_env["LDFLAGS"] = (profile_env.get("LDFLAGS", "") +
+                              " -fprofile-generate")
+    run_args = dict(cwd=build_dir, env=profile_env)
+    subprocess.run([os.path.join(build_dir, "configure")], **run_args)
+    subprocess.run(["make", "minigzip", "-j", str(cpu_count)], **run_args)
+    minigzip = os.path.join(build_dir, "minigzip")
+    training_data = b"".join(path.read_bytes() for path in
+                             sorted(Path(build_dir).glob("*.[ch]")))
+    for level in ("-1", "-6", "-9"):
+        compressed = subprocess.run(
+            [minigzip, "-c", level], input=training_data,
+            stdout=subprocess.PIPE, **run_args).stdout
+        subprocess.run([minigzip, "-d", "-c"], input=compressed,
+                       stdout=subprocess.DEVNULL, **run_args)
+    # Remove the instrumented objects, but keep the .gcda profile data.
+    for path in Path(build_dir).rglob("*.o"):
+        path.unlink()
+    build_env["CFLAGS"] += " -fprofile-use -Wno-missing-profile"
+
+
 setup(
     name="zlib-ng",
     version=versioningit.get_version(),
@@ -12,8 +12,20 @@
 #   been overwritten with the same methods, but now calling to zlib_ng.
 # - _GzipReader._add_read_data uses zlib_ng.crc32 instead of zlib.crc32.
 # - compress, decompress use zlib_ng methods rather than zlib.
+# - compress lets zlib-ng write the mtime and OS byte in the header.
+# - decompress preallocates its output using the size in the gzip trailer.
+# - GzipNGFile buffers writes using an io.BufferedWriter as is done in
+#   CPython 3.12 and later, on all supported Python versions.
+# - GzipNGFile lets zlib-ng write the gzip header and trailer, so the crc32 is
+#   calculated by zlib-ng during compression.
+# - Compressed data is written to the fileobj by _GzipWriter, which is
+#   implemented in C, rather than by GzipNGFile._write_raw.
 # - The main() function's gzip utility supports many more options for easier
 #   use. This was ported from the python-isal module
+# - The main() function can compress using multiple threads with the
+#   gzip_ng_threaded module.
+# - The main() function copies data using readinto with a single reusable
+#   buffer rather than shutil.copyfileobj.
 
 """Similar to the stdlib gzip module. But using zlib-ng to speed up its
 methods."""
@@ -22,13 +34,11 @@ import argparse
 import gzip
 import io
 import os
-import shutil
-import struct
 import sys
 import time
 
 from . import zlib_ng
-from .zlib_ng import _GzipReader
+from .zlib_ng import _GzipReader, _GzipWriter
 
 __all__ = ["GzipFile", "open", "compress", "decompress", "BadGzipFile",
            "READ_BUFFER_SIZE"]
@@ -39,7 +49,13 @@ _COMPRESS_LEVEL_BEST = zlib_ng.Z_BEST_COMPRESSION
 
 # The amount of data that is read in at once when decompressing a file.
 # Increasing this value may increase performance.
-READ_BUFFER_SIZE = 512 * 1024
+READ_BUFFER_SIZE = 1024 * 1024
+
+# The amount of data that is buffered before it is passed to the compressor
+# when writing. This collapses many small writes into a few large ones.
+_WRITE_BUFFER_SIZE = 128 * 1024
+
+_BINARY_MODES = frozenset(("r", "rb", "w", "wb", "a", "ab", "x", "xb"))
 
 FTEXT, FHCRC, FEXTRA, FNAME, FCOMMENT = 1, 2, 4, 8, 16
 READ, WRITE = gzip.READ, gzip.WRITE
@@ -50,8 +66,8 @@ BadGzipFile = gzip.BadGzipFile  # type: ignore
 # The open method was copied from the CPython source with minor adjustments.
 def open(filename, mode="rb", compresslevel=_COMPRESS_LEVEL_TRADEOFF,
          encoding=None, errors=None, newline=None):
-    """Open a gzip-compressed file in binary or text mode. This uses the isa-l
-    library for optimized speed.
+    """Open a gzip-compressed file in binary or text mode. This uses the
+    zlib-ng library for optimized speed.
 
     The filename argument can be an actual filename (a str or bytes object), or
     an existing file object to read from or write to.
@@ -68,6 +84,10 @@ def open(filename, mode="rb", compresslevel=_COMPRESS_LEVEL_TRADEOFF,
     io.TextIOWrapper instance with the specified encoding, error handling
     behavior, and line ending(s).
     """
+    # Fast path for the most common case of opening a path in binary mode.
+    if (mode in _BINARY_MODES and isinstance(filename, str) and
+            encoding is None and errors is None and newline is None):
+        return GzipNGFile(filename, mode, compresslevel)
     if "t" in mode:
         if "b" in mode:
             raise ValueError("Invalid mode: %r" % (mode,))
@@ -128,10 +148,11 @@ class GzipNGFile(gzip.GzipFile):
         default is 'rb'. A mode of 'r' is equivalent to one of 'rb', and
         similarly for 'w' and 'wb', 'a' and 'ab', and 'x' and 'xb'.
 
-        The compresslevel argument is an integer from 0 to 3 controlling the
-        level of compression; 0 is fastest and produces the least compression,
-        and 3 is slowest and produces the most compression. Unlike
-        gzip.GzipFile 0 is NOT no compression. The default is 2.
+        The compresslevel argument is an integer from 0 to 9 controlling the
+        level of compression; 1 is fastest and produces the least compression,
+        and 9 is slowest and produces the most compression. 0 is no
+        compression at all. The default is 9, as in gzip.GzipFile. open()
+        uses the considerably faster level 6 by default.
 
         The mtime argument is an optional numeric timestamp to be written
         to the last modification time field in the stream when compressing.
@@ -139,11 +160,10 @@ class GzipNGFile(gzip.GzipFile):
         """
         super().__init__(filename, mode, compresslevel, fileobj, mtime)
         if self.mode == WRITE:
-            self.compress = zlib_ng.compressobj(compresslevel,
-                                                zlib_ng.DEFLATED,
-                                                -zlib_ng.MAX_WBITS,
-                                                zlib_ng.DEF_MEM_LEVEL,
-                                                0)
+            self._buffer_size = _WRITE_BUFFER_SIZE
+            self._buffer = io.BufferedWriter(self._gzip_writer,
+                                             buffer_size=self._buffer_size)
+            self._buffer_write = self._buffer.write
         if self.mode == READ:
             raw = _GzipReader(self.fileobj, READ_BUFFER_SIZE)
             self._buffer = io.BufferedReader(raw)
@@ -152,28 +172,118 @@ class GzipNGFile(gzip.GzipFile):
         s = repr(self.fileobj)
         return '<gzip_ng ' + s[1:-1] + ' ' + hex(id(self)) + '>'
 
+    def _write_gzip_header(self, compresslevel):
+        # Rather than writing the header here, let zlib-ng write the header
+        # and the trailer. This way zlib-ng computes the crc32 while it
+        # copies the data into its window, which saves a pass over the data.
+        # _GzipWriter compresses and writes to the fileobj entirely in C.
+        try:
+            # RFC 1952 requires the FNAME field to be Latin-1. Do not
+            # include filenames that cannot be represented that way.
+            fname = os.path.basename(self.name)
+            if not isinstance(fname, bytes):
+                fname = fname.encode('latin-1')
+            if fname.endswith(b'.gz'):
+                fname = fname[:-3]
+        except UnicodeEncodeError:
+            fname = b''
+        mtime = self._write_mtime
+        if mtime is None:
+            mtime = time.time()
+        self._gzip_writer = _GzipWriter(self.fileobj, compresslevel,
+                                        int(mtime), fname)
+
     def write(self, data):
-        self._check_not_closed()
-        if self.mode != WRITE:
+        # This method is called for every line when writing line by line, so
+        # the checks are combined and the bound write method is cached.
+        if self.fileobj is None or self.mode != WRITE:
+            self._check_not_closed()
             import errno
             raise OSError(errno.EBADF, "write() on read-only GzipNGFile object")
+        return self._buffer_write(data)
+
+    def writelines(self, lines):
+        # io.IOBase.writelines calls self.write for each line, which is
+        # implemented in Python. Passing the lines to the BufferedWriter
+        # keeps the loop in C, and the lines are collected in its buffer
+        # before being compressed.
+        if self.fileobj is None or self.mode != WRITE:
+            self._check_not_closed()
+            import errno
+            raise OSError(errno.EBADF,
+                          "writelines() on read-only GzipNGFile object")
+        self._buffer.writelines(lines)
+
+    def readinto(self, b):
+        """Read bytes into a pre-allocated, writable bytes-like object b and
+        return the number of bytes read. This avoids creating a new bytes
+        object for every read."""
+        self._check_not_closed()
+        if self.mode != READ:
+            import errno
+            raise OSError(errno.EBADF, "readinto() on write-only GzipNGFile "
+                                       "object")
+        return self._buffer.readinto(b)
 
-        if self.fileobj is None:
-            raise ValueError("write() on closed GzipNGFile object")
+    def _sync_size(self):
+        # The uncompressed size is tracked by _GzipWriter. Since only forward
+        # seeks are possible in write mode, the offset equals the size.
+        self.size = self.offset = self._gzip_writer.tell()
 
-        if isinstance(data, bytes):
-            length = len(data)
-        else:
-            # accept any data that supports the buffer protocol
-            data = memoryview(data)
-            length = data.nbytes
+    def flush(self, zlib_mode=zlib_ng.Z_SYNC_FLUSH):
+        self._check_not_closed()
+        if self.mode == WRITE:
+            self._buffer.flush()
+            self._gzip_writer.flush(zlib_mode)
+            self._sync_size()
+            self.fileobj.flush()
+
+    def close(self):
+        fileobj = self.fileobj
+        if fileobj is None or self.mode != WRITE:
+            return super().close()
+        try:
+            # Closing the buffer flushes it and closes the _GzipWriter, which
+            # writes the gzip trailer with the crc32 and size.
+            self._buffer.close()
+            self._sync_size()
+        finally:
+            self.fileobj = None
+            myfileobj = self.myfileobj
+            if myfileobj:
+                self.myfileobj = None
+                myfileobj.close()
+
+    def tell(self):
+        self._check_not_closed()
+        if self.mode == WRITE:
+            # Flush buffer to ensure validity of self.offset
+            self._buffer.flush()
+            self._sync_size()
+        return super().tell()
 
-        if length > 0:
-            self.fileobj.write(self.compress.compress(data))
-            self.size += length
-            self.crc = zlib_ng.crc32(data, self.crc)
-            self.offset += length
-        return length
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.mode != WRITE:
+            return super().seek(offset, whence)
+        self._check_not_closed()
+        # Flush buffer to ensure validity of self.offset
+        self._buffer.flush()
+        self._sync_size()
+        if whence != io.SEEK_SET:
+            if whence == io.SEEK_CUR:
+                offset = self.offset + offset
+            else:
+                raise ValueError('Seek from end not supported')
+        if offset < self.offset:
+            raise OSError('Negative seek in write mode')
+        count = offset - self.offset
+        chunk = b'\0' * self._buffer_size
+        for i in range(count // self._buffer_size):
+            self._buffer.write(chunk)
+        self._buffer.write(b'\0' * (count % self._buffer_size))
+        self._buffer.flush()
+        self._sync_size()
+        return self.offset
 
 
 # Aliases for improved compatibility with CPython gzip module.
@@ -187,20 +297,19 @@ def compress(data, compresslevel=_COMPRESS_LEVEL_BEST, *, mtime=None):
     mtime can be used to set the modification time. The modification time is
     set to the current time by default.
     """
-    # Wbits=31 automatically includes a gzip header and trailer.
-    gzip_data = zlib_ng.compress(data, level=compresslevel, wbits=31)
     if mtime is None:
         mtime = time.time()
-    # Reuse gzip header created by zlib_ng, replace mtime and OS byte for
-    # consistency.
-    header = struct.pack("<4sLBB", gzip_data, int(mtime), gzip_data[8], 255)
-    return header + gzip_data[10:]
+    # The mtime and OS byte are written in the header by zlib-ng directly, so
+    # the compressed data does not need to be copied to replace the header.
+    return zlib_ng._gzip_compress(data, compresslevel, int(mtime))
 
 
 def decompress(data):
     """Decompress a gzip compressed string in one shot.
     Return the decompressed string.
     """
+    # For single member data, readall allocates the output at once using the
+    # size stored in the gzip trailer.
     reader = _GzipReader(data)
     return reader.readall()
 
@@ -240,6 +349,11 @@ def _argument_parser():
                              "timestamp")
     parser.add_argument("-f", "--force", action="store_true",
                         help="Overwrite output without prompting")
+    parser.add_argument("-T", "--threads", type=int, default=0,
+                        help="Compress using this many threads. 0 (default) "
+                             "does not use threads. A negative value uses "
+                             "all available threads. The original name and "
+                             "timestamp are not saved when threads are used.")
     # -b flag not taken by gzip. Hidden attribute.
     parser.add_argument("-b", "--buffer-size",
                         default=READ_BUFFER_SIZE, type=int,
@@ -247,6 +361,20 @@ def _argument_parser():
     return parser
 
 
+def _copy_stream(in_file, out_file, buffer_size):
+    # Like shutil.copyfileobj, but reads into a single preallocated buffer
+    # rather than creating a new bytes object for every block.
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    readinto = in_file.readinto
+    write = out_file.write
+    while True:
+        read_bytes = readinto(buffer)
+        if not read_bytes:
+            break
+        write(view[:read_bytes])
+
+
 def main():
     args = _argument_parser().parse_args()
 
@@ -273,12 +401,18 @@ def main():
             if yes_or_no not in {"y", "Y", "yes"}:
                 sys.exit("not overwritten")
 
+    global READ_BUFFER_SIZE
+    READ_BUFFER_SIZE = args.buffer_size
+
+    # Input files are opened unbuffered. Data is read in blocks of
+    # args.buffer_size, so a BufferedReader would only add overhead.
+    in_buffer = None
     out_buffer = None
     if args.compress:
         if args.file is None:
             in_file = sys.stdin.buffer
         else:
-            in_file = io.open(args.file, mode="rb")
+            in_file = io.open(args.file, mode="rb", buffering=0)
         if out_filepath is not None:
             out_buffer = io.open(out_filepath, "wb")
         else:
@@ -288,25 +422,33 @@ def main():
             gzip_file_kwargs = {"mtime": 0, "filename": b""}
         else:
             gzip_file_kwargs = {"filename": out_filepath}
-        out_file = GzipNGFile(mode="wb", fileobj=out_buffer,
-                              compresslevel=compresslevel, **gzip_file_kwargs)
+        if args.threads:
+            # Imported here as gzip_ng_threaded depends on this module.
+            from . import gzip_ng_threaded
+            out_file = gzip_ng_threaded.open(out_buffer, "wb", compresslevel,
+                                             threads=args.threads)
+        else:
+            out_file = GzipNGFile(mode="wb", fileobj=out_buffer,
+                                  compresslevel=compresslevel,
+                                  **gzip_file_kwargs)
     else:
         if args.file:
-            in_file = open(args.file, mode="rb")
+            in_buffer = io.open(args.file, mode="rb", buffering=0)
         else:
-            in_file = GzipNGFile(mode="rb", fileobj=sys.stdin.buffer)
+            in_buffer = sys.stdin.buffer
+        in_file = GzipNGFile(mode="rb", fileobj=in_buffer)
         if out_filepath is not None:
             out_file = io.open(out_filepath, mode="wb")
         else:
             out_file = sys.stdout.buffer
 
-    global READ_BUFFER_SIZE
-    READ_BUFFER_SIZE = args.buffer_size
     try:
-        shutil.copyfileobj(in_file, out_file, args.buffer_size)
+        _copy_stream(in_file, out_file, args.buffer_size)
     finally:
         if in_file is not sys.stdin.buffer:
             in_file.close()
+        if in_buffer is not None and in_buffer is not sys.stdin.buffer:
+            in_buffer.close()
         if out_file is not sys.stdout.buffer:
             out_file.close()
         if out_buffer is not None and out_buffer is not sys.stdout.buffer:
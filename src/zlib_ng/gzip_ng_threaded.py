@@ -18,6 +18,9 @@ from . import gzip_ng, zlib_ng
 
 DEFLATE_WINDOW_SIZE = 2 ** 15
 
+_GZIP_HEADER_STRUCT = struct.Struct("<BBBBIBB")
+_GZIP_TRAILER_STRUCT = struct.Struct("<II")
+
 
 def open(filename, mode="rb", compresslevel=gzip_ng._COMPRESS_LEVEL_TRADEOFF,
          encoding=None, errors=None, newline=None, *, threads=1,
@@ -126,25 +129,47 @@ class _ThreadedGzipReader(io.RawIOBase):
                 except queue.Full:
                     pass
 
+    def _get_block(self) -> Optional[bytes]:
+        """Get the next decompressed block. Return None at EOF."""
+        while True:
+            try:
+                return self.queue.get(timeout=0.01)
+            except queue.Empty:
+                # The worker can not add blocks after it has stopped, so an
+                # empty queue at that point is reliable.
+                if not self.worker.is_alive() and self.queue.empty():
+                    if self.exception:
+                        raise self.exception
+                    # EOF reached
+                    return None
+
     def readinto(self, b):
         self._check_closed()
         result = self.buffer.readinto(b)
         if result == 0:
-            while True:
-                try:
-                    data_from_queue = self.queue.get(timeout=0.01)
-                    break
-                except queue.Empty:
-                    if not self.worker.is_alive():
-                        if self.exception:
-                            raise self.exception
-                        # EOF reached
-                        return 0
+            data_from_queue = self._get_block()
+            if data_from_queue is None:
+                return 0
             self.buffer = io.BytesIO(data_from_queue)
             result = self.buffer.readinto(b)
         self.pos += result
         return result
 
+    def readall(self) -> bytes:
+        # io.BufferedReader.read() uses this method when it is available.
+        # Joining the blocks is much faster than RawIOBase.readall, which
+        # copies the data in DEFAULT_BUFFER_SIZE chunks using readinto.
+        self._check_closed()
+        blocks = [self.buffer.read()]
+        while True:
+            block = self._get_block()
+            if block is None:
+                break
+            blocks.append(block)
+        data = b"".join(blocks)
+        self.pos += len(data)
+        return data
+
     def readable(self) -> bool:
         return True
 
@@ -280,8 +305,8 @@ class _ThreadedGzipWriter(io.RawIOBase):
             xfl = 4
         else:
             xfl = 0
-        self.raw.write(struct.pack(
-            "BBBBIBB", magic1, magic2, method, flags, mtime, os, xfl))
+        self.raw.write(_GZIP_HEADER_STRUCT.pack(
+            magic1, magic2, method, flags, mtime, os, xfl))
 
     def start(self):
         self.running = True
@@ -298,9 +323,11 @@ class _ThreadedGzipWriter(io.RawIOBase):
 
     def write(self, b) -> int:
         self._check_closed()
-        with self.lock:
-            if self.exception:
-                raise self.exception
+        # Any worker or the writer thread may set the exception. Reading the
+        # attribute is atomic and any value other than None means an error
+        # must be raised, so the lock is not needed here.
+        if self.exception:
+            raise self.exception
         length = b.nbytes if isinstance(b, memoryview) else len(b)
         if length > self.block_size:
             # write smaller chunks and return the result
@@ -331,7 +358,8 @@ class _ThreadedGzipWriter(io.RawIOBase):
             out_q.join()
         # Write an empty deflate block with a lost block marker.
         self.raw.write(zlib_ng.compress(b"", wbits=-15))
-        trailer = struct.pack("<II", self._crc, self._size & 0xFFFFFFFF)
+        trailer = _GZIP_TRAILER_STRUCT.pack(self._crc,
+                                            self._size & 0xFFFFFFFF)
         self.raw.write(trailer)
         self._crc = 0
         self._size = 0
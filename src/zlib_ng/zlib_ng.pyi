@@ -48,6 +48,7 @@ def compress(__data,
 def decompress(__data,
                wbits: int = MAX_WBITS,
                bufsize: int = DEF_BUF_SIZE) -> bytes: ...
+def _gzip_compress(__data, __level: int, __mtime: int) -> bytes: ...
 
 class _Compress:
     def compress(self, __data) -> bytes: ...
@@ -97,3 +98,18 @@ class _GzipReader:
     def readall(self) -> bytes: ...
     def read(self, __size: int): ...
     def flush(self): ...
+
+class _GzipWriter:
+    closed: bool
+
+    def __init__(self, __fp: typing.BinaryIO,
+                 level: int = Z_DEFAULT_COMPRESSION,
+                 mtime: int = 0,
+                 filename: bytes = b""): ...
+    def write(self, __data) -> int: ...
+    def flush(self, __mode: int = Z_SYNC_FLUSH): ...
+    def close(self): ...
+    def readable(self) -> bool: ...
+    def writable(self) -> bool: ...
+    def seekable(self) -> bool: ...
+    def tell(self) -> int: ...
@@ -196,8 +196,26 @@ arrange_output_buffer(zng_stream *zst, PyObject **buffer, Py_ssize_t length)
     return ret;
 }
 
+/* Converter for PyArg_Parse* "O&" that stores a gzip header mtime. */
+static int
+mtime_converter(PyObject *obj, void *ptr)
+{
+    unsigned long mtime = PyLong_AsUnsignedLong(obj);
+    if (mtime == (unsigned long)-1 && PyErr_Occurred()) {
+        return 0;
+    }
+    if (mtime > UINT32_MAX) {
+        PyErr_Format(PyExc_OverflowError,
+                     "mtime must be at most %u, got %lu", UINT32_MAX, mtime);
+        return 0;
+    }
+    *(uint32_t *)ptr = (uint32_t)mtime;
+    return 1;
+}
+
 static PyObject *
-zlib_compress_impl(PyObject *module, Py_buffer *data, int level, int wbits)
+zlib_compress_impl(PyObject *module, Py_buffer *data, int level, int wbits,
+                   zng_gz_header *gzhead)
 {
     PyObject *return_value = NULL;
     Py_ssize_t obuflen = DEF_BUF_SIZE;
@@ -230,6 +248,15 @@ zlib_compress_impl(PyObject *module, Py_buffer *data, int level, int wbits)
         goto error;
     }
 
+    if (gzhead != NULL) {
+        err = zng_deflateSetHeader(&zst, gzhead);
+        if (err != Z_OK) {
+            zng_deflateEnd(&zst);
+            zlib_error(zst, err, "while setting the gzip header");
+            goto error;
+        }
+    }
+
     do {
         arrange_input_buffer(&zst, &ibuflen);
         flush = ibuflen == 0 ? Z_FINISH : Z_NO_FLUSH;
@@ -1805,7 +1832,7 @@ PyDoc_STRVAR(zlib_compress__doc__,
 "  data\n"
 "    Binary data to be compressed.\n"
 "  level\n"
-"    Compression level, in 0-3.\n"
+"    Compression level, in 0-9 or -1.\n"
 "  wbits\n"
 "    The window buffer size and container format.");
 
@@ -1827,7 +1854,88 @@ zlib_compress(PyObject *module, PyObject *args, PyObject *kwargs)
         return NULL;
     }
 
-    PyObject *return_value = zlib_compress_impl(module, &data, level, wbits);
+    PyObject *return_value = zlib_compress_impl(module, &data, level, wbits,
+                                                NULL);
+    PyBuffer_Release(&data);
+    return return_value;
+}
+
+PyDoc_STRVAR(zlib__gzip_compress__doc__,
+"_gzip_compress($module, data, level, mtime, /)\n"
+"--\n"
+"\n"
+"Returns a bytes object containing the data compressed in a gzip container.\n"
+"The mtime is written in the header and the OS field is set to 255\n"
+"(unknown), so the header does not have to be rewritten afterwards.\n"
+"\n"
+"  data\n"
+"    Binary data to be compressed.\n"
+"  level\n"
+"    Compression level, in 0-9 or -1.\n"
+"  mtime\n"
+"    The modification time that is stored in the header.");
+
+#define ZLIB__GZIP_COMPRESS_METHODDEF    \
+    {"_gzip_compress", (PyCFunction)(void(*)(void))zlib__gzip_compress, \
+     METH_VARARGS, zlib__gzip_compress__doc__}
+
+/* Compressing empty data costs as much as setting up a deflate state, which
+   dominates for the tiny payloads of RPC frameworks. Write the result that
+   zlib-ng produces for empty input directly instead. */
+static PyObject *
+gzip_compress_empty(int level, uint32_t mtime)
+{
+    static const uint8_t empty_stored_block[] = {0x01, 0x00, 0x00, 0xff, 0xff};
+    static const uint8_t empty_fixed_block[] = {0x03, 0x00};
+    const uint8_t *block = empty_fixed_block;
+    Py_ssize_t block_size = sizeof(empty_fixed_block);
+    if (level == 0) {
+        block = empty_stored_block;
+        block_size = sizeof(empty_stored_block);
+    }
+    PyObject *result = PyBytes_FromStringAndSize(NULL, 10 + block_size + 8);
+    if (result == NULL) {
+        return NULL;
+    }
+    uint8_t *out = (uint8_t *)PyBytes_AS_STRING(result);
+    out[0] = 0x1f;
+    out[1] = 0x8b;
+    out[2] = Z_DEFLATED;
+    out[3] = 0;  // No flags
+    out[4] = mtime & 0xff;
+    out[5] = (mtime >> 8) & 0xff;
+    out[6] = (mtime >> 16) & 0xff;
+    out[7] = (mtime >> 24) & 0xff;
+    // Extra flags are set the same way as in zlib-ng's deflate.
+    out[8] = level == 9 ? 2 : (level >= 0 && level < 2 ? 4 : 0);
+    out[9] = 255;  // OS unknown
+    memcpy(out + 10, block, block_size);
+    // The crc32 and size of empty data are both zero.
+    memset(out + 10 + block_size, 0, 8);
+    return result;
+}
+
+static PyObject *
+zlib__gzip_compress(PyObject *module, PyObject *args)
+{
+    Py_buffer data = {NULL, NULL};
+    int level = Z_DEFAULT_COMPRESSION;
+    uint32_t mtime = 0;
+
+    if (!PyArg_ParseTuple(args, "y*iO&:_gzip_compress",
+                          &data, &level, mtime_converter, &mtime)) {
+        return NULL;
+    }
+    if (data.len == 0 && level >= Z_DEFAULT_COMPRESSION && level <= 9) {
+        PyBuffer_Release(&data);
+        return gzip_compress_empty(level, mtime);
+    }
+    zng_gz_header gzhead;
+    memset(&gzhead, 0, sizeof(zng_gz_header));
+    gzhead.time = mtime;
+    gzhead.os = 255;
+    PyObject *return_value = zlib_compress_impl(module, &data, level,
+                                                16 + MAX_WBITS, &gzhead);
     PyBuffer_Release(&data);
     return return_value;
 }
@@ -2283,7 +2391,9 @@ GzipReader__new__(PyTypeObject *type, PyObject *args, PyObject *kwargs)
         return NULL;
     }
     GzipReader *self = PyObject_New(GzipReader, type);
-    if (PyObject_HasAttrString(fp, "read")) {
+    /* bytes objects are checked first, to avoid the cost of the failed
+       attribute lookup in the common case of decompressing bytes. */
+    if (!PyBytes_CheckExact(fp) && PyObject_HasAttrString(fp, "read")) {
         self->memview = NULL;
         self->buffer_size = buffer_size;
         self->input_buffer = PyMem_Malloc(self->buffer_size);
@@ -2745,26 +2855,53 @@ GzipReader_seek(GzipReader *self, PyObject *args, PyObject *kwargs)
     return PyLong_FromLongLong(self->_pos);
 }
 
+/* Upper limit for the first readall chunk that is sized from ISIZE. */
+#define READALL_MAX_PREALLOC (256 * 1024 * 1024)
+
 static PyObject *
 GzipReader_readall(GzipReader *self, PyObject *Py_UNUSED(ignore))
 {
     /* Try to consume the entire buffer without too much overallocation */
     Py_ssize_t chunk_size = self->buffer_size * 4;
+    Py_ssize_t first_chunk_size = chunk_size;
+    /* For in-memory data read from the start, the ISIZE field at the end of
+       the data gives the decompressed size of single member gzip data. Use
+       it to decompress everything in one go. One byte extra is allocated so
+       reaching the end of the data can be detected without another read.
+       ISIZE can not be trusted, so the preallocation is limited to 64 times
+       the input size and to READALL_MAX_PREALLOC. Larger outputs are
+       collected in further chunks. ISIZE is 0 for empty members, such as
+       the BGZF end-of-file marker, in which case the default is kept. */
+    if (self->memview != NULL && self->_pos == 0 && self->buffer_size >= 18) {
+        uint32_t isize = load_u32_le(self->buffer_end - 4);
+        Py_ssize_t max_size = READALL_MAX_PREALLOC;
+        if (self->buffer_size < READALL_MAX_PREALLOC / 64) {
+            max_size = self->buffer_size * 64;
+        }
+        max_size = Py_MAX(chunk_size, max_size);
+        if (isize != 0) {
+            if ((size_t)isize < (size_t)max_size) {
+                first_chunk_size = (Py_ssize_t)isize + 1;
+            } else {
+                first_chunk_size = max_size;
+            }
+        }
+    }
     /* Rather than immediately creating a list, read one chunk first and
        only create a list when more read operations are necessary. */
-    PyObject *first_chunk = PyBytes_FromStringAndSize(NULL, chunk_size);
+    PyObject *first_chunk = PyBytes_FromStringAndSize(NULL, first_chunk_size);
     if (first_chunk == NULL) {
         return NULL;
     }
     ENTER_ZLIB(self);
     Py_ssize_t written_size = GzipReader_read_into_buffer(
-        self, (uint8_t *)PyBytes_AS_STRING(first_chunk), chunk_size);
+        self, (uint8_t *)PyBytes_AS_STRING(first_chunk), first_chunk_size);
     LEAVE_ZLIB(self);
     if (written_size < 0) {
         Py_DECREF(first_chunk);
         return NULL;
     }
-    if (written_size < chunk_size) {
+    if (written_size < first_chunk_size) {
         if (_PyBytes_Resize(&first_chunk, written_size) < 0) {
             return NULL;
         }
@@ -2929,6 +3066,344 @@ static PyTypeObject GzipReader_Type = {
     .tp_getset = GzipReader_properties,
 };
 
+/* Size of the buffer that compressed data is collected in before it is
+   passed to fp.write. */
+#define GZIP_WRITER_BUFFER_SIZE (128 * 1024)
+
+typedef struct _GzipWriterStruct {
+    PyObject_HEAD
+    uint8_t *buffer;
+    uint32_t buffer_size;
+    uint32_t buffer_used;
+    uint64_t _size;
+    PyObject *fp;
+    char *filename;
+    char closed;
+    zng_gz_header gzhead;
+    PyThread_type_lock lock;
+    zng_stream zst;
+    uint8_t is_initialised;
+} GzipWriter;
+
+static void GzipWriter_dealloc(GzipWriter *self)
+{
+    PyMem_Free(self->buffer);
+    PyMem_Free(self->filename);
+    Py_XDECREF(self->fp);
+    if (self->lock != NULL) {
+        PyThread_free_lock(self->lock);
+    }
+    if (self->is_initialised) {
+        zng_deflateEnd(&self->zst);
+    }
+    Py_TYPE(self)->tp_free(self);
+}
+
+PyDoc_STRVAR(GzipWriter__new____doc__,
+"_GzipWriter(fp, /, level=Z_DEFAULT_COMPRESSION, mtime=0, filename=b'')\n"
+"--\n"
+"\n"
+"Return a _GzipWriter object. This is a raw stream that compresses all data\n"
+"written to it into a single gzip member and writes the result to fp.\n"
+"The gzip header and trailer are written by zlib-ng, which calculates the\n"
+"crc32 while compressing.\n"
+"\n"
+"  fp\n"
+"    A file-like binary IO object with a write method.\n"
+"  level\n"
+"    Compression level, in 0-9 or -1.\n"
+"  mtime\n"
+"    The modification time that is stored in the header.\n"
+"  filename\n"
+"    The original filename that is stored in the header. No filename is\n"
+"    stored when it is empty.\n"
+);
+
+static PyObject *
+GzipWriter__new__(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    PyObject *fp = NULL;
+    int level = Z_DEFAULT_COMPRESSION;
+    uint32_t mtime = 0;
+    const char *filename = "";
+    /* fp is positional-only, as documented in the signature. */
+    static char *keywords[] = {"", "level", "mtime", "filename", NULL};
+    static char *format = "O|iO&y:_GzipWriter";
+    if (!PyArg_ParseTupleAndKeywords(
+            args, kwargs, format, keywords,
+            &fp, &level, mtime_converter, &mtime, &filename)) {
+        return NULL;
+    }
+    GzipWriter *self = PyObject_New(GzipWriter, type);
+    if (self == NULL) {
+        return PyErr_NoMemory();
+    }
+    self->buffer = NULL;
+    self->filename = NULL;
+    self->fp = NULL;
+    self->lock = NULL;
+    self->is_initialised = 0;
+    self->closed = 0;
+    self->_size = 0;
+    self->zst.next_in = NULL;
+    self->zst.avail_in = 0;
+    self->zst.opaque = NULL;
+    self->zst.zalloc = PyZlib_Malloc;
+    self->zst.zfree = PyZlib_Free;
+    int err = zng_deflateInit2(&self->zst, level, DEFLATED, 16 + MAX_WBITS,
+                               DEF_MEM_LEVEL, Z_DEFAULT_STRATEGY);
+    switch (err) {
+    case Z_OK:
+        break;
+    case Z_MEM_ERROR:
+        PyErr_SetString(PyExc_MemoryError,
+                        "Out of memory while compressing data");
+        Py_DECREF(self);
+        return NULL;
+    case Z_STREAM_ERROR:
+        PyErr_SetString(ZlibError, "Bad compression level");
+        Py_DECREF(self);
+        return NULL;
+    default:
+        zng_deflateEnd(&self->zst);
+        zlib_error(self->zst, err, "while compressing data");
+        Py_DECREF(self);
+        return NULL;
+    }
+    self->is_initialised = 1;
+
+    size_t filename_length = strlen(filename);
+    if (filename_length) {
+        self->filename = PyMem_Malloc(filename_length + 1);
+        if (self->filename == NULL) {
+            Py_DECREF(self);
+            return PyErr_NoMemory();
+        }
+        memcpy(self->filename, filename, filename_length + 1);
+    }
+    memset(&self->gzhead, 0, sizeof(zng_gz_header));
+    self->gzhead.time = mtime;
+    self->gzhead.os = 255;
+    self->gzhead.name = (uint8_t *)self->filename;
+    /* The header is stored by reference in the stream state, which is why
+       it is part of the struct and the filename is copied. */
+    err = zng_deflateSetHeader(&self->zst, &self->gzhead);
+    if (err != Z_OK) {
+        zlib_error(self->zst, err, "while setting the gzip header");
+        Py_DECREF(self);
+        return NULL;
+    }
+    self->buffer = PyMem_Malloc(GZIP_WRITER_BUFFER_SIZE);
+    if (self->buffer == NULL) {
+        Py_DECREF(self);
+        return PyErr_NoMemory();
+    }
+    self->buffer_size = GZIP_WRITER_BUFFER_SIZE;
+    self->buffer_used = 0;
+    self->lock = PyThread_allocate_lock();
+    if (self->lock == NULL) {
+        Py_DECREF(self);
+        PyErr_SetString(PyExc_MemoryError, "Unable to allocate lock");
+        return NULL;
+    }
+    Py_INCREF(fp);
+    self->fp = fp;
+    return (PyObject *)self;
+}
+
+/* Pass the compressed data in the buffer to fp.write and empty the buffer.
+   Returns 0 on success and -1 with an exception set on failure. */
+static int
+GzipWriter_write_buffer(GzipWriter *self)
+{
+    if (self->buffer_used == 0) {
+        return 0;
+    }
+    PyObject *chunk = PyBytes_FromStringAndSize(
+        (char *)self->buffer, self->buffer_used);
+    if (chunk == NULL) {
+        return -1;
+    }
+    PyObject *ret = PyObject_CallMethod(self->fp, "write", "O", chunk);
+    Py_DECREF(chunk);
+    if (ret == NULL) {
+        return -1;
+    }
+    Py_DECREF(ret);
+    self->buffer_used = 0;
+    return 0;
+}
+
+/* Compress length bytes from data. After all data is consumed, deflate is
+   called with the given flush mode. Compressed data is collected in the
+   buffer and only passed to fp.write when the buffer is full, or when mode
+   is not Z_NO_FLUSH. This way fp.write is called with large blocks, even
+   when each call only produces a little compressed data.
+   Must be called with the lock held.
+   Returns 0 on success and -1 with an exception set on failure. */
+static int
+GzipWriter_compress(GzipWriter *self, uint8_t *data, Py_ssize_t length,
+                    int mode)
+{
+    Py_ssize_t remaining = length;
+    int flush;
+    int err;
+    self->zst.next_in = data;
+    do {
+        arrange_input_buffer(&self->zst, &remaining);
+        flush = remaining == 0 ? mode : Z_NO_FLUSH;
+        do {
+            if (self->buffer_used == self->buffer_size) {
+                if (GzipWriter_write_buffer(self) < 0) {
+                    return -1;
+                }
+            }
+            self->zst.next_out = self->buffer + self->buffer_used;
+            self->zst.avail_out = self->buffer_size - self->buffer_used;
+
+            Py_BEGIN_ALLOW_THREADS
+            err = zng_deflate(&self->zst, flush);
+            Py_END_ALLOW_THREADS
+
+            if (err == Z_STREAM_ERROR) {
+                zlib_error(self->zst, err, "while compressing data");
+                return -1;
+            }
+            self->buffer_used = self->zst.next_out - self->buffer;
+        } while (self->zst.avail_out == 0);
+    } while (remaining != 0);
+    if (mode != Z_NO_FLUSH) {
+        return GzipWriter_write_buffer(self);
+    }
+    return 0;
+}
+
+static PyObject *
+GzipWriter_write(GzipWriter *self, PyObject *data)
+{
+    if (self->closed) {
+        PyErr_SetString(PyExc_ValueError, "I/O operation on closed file.");
+        return NULL;
+    }
+    Py_buffer buffer;
+    if (PyObject_GetBuffer(data, &buffer, PyBUF_SIMPLE) < 0) {
+        return NULL;
+    }
+    Py_ssize_t length = buffer.len;
+    ENTER_ZLIB(self);
+    int ret = GzipWriter_compress(
+        self, buffer.buf, length, Z_NO_FLUSH);
+    if (ret == 0) {
+        self->_size += length;
+    }
+    LEAVE_ZLIB(self);
+    PyBuffer_Release(&buffer);
+    if (ret < 0) {
+        return NULL;
+    }
+    return PyLong_FromSsize_t(length);
+}
+
+static PyObject *
+GzipWriter_flush(GzipWriter *self, PyObject *args)
+{
+    int mode = Z_SYNC_FLUSH;
+    if (!PyArg_ParseTuple(args, "|i:_GzipWriter.flush", &mode)) {
+        return NULL;
+    }
+    if (self->closed) {
+        PyErr_SetString(PyExc_ValueError, "I/O operation on closed file.");
+        return NULL;
+    }
+    if (mode == Z_NO_FLUSH) {
+        Py_RETURN_NONE;
+    }
+    ENTER_ZLIB(self);
+    int ret = GzipWriter_compress(self, NULL, 0, mode);
+    LEAVE_ZLIB(self);
+    if (ret < 0) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+GzipWriter_close(GzipWriter *self, PyObject *Py_UNUSED(ignore))
+{
+    if (self->closed) {
+        Py_RETURN_NONE;
+    }
+    ENTER_ZLIB(self);
+    /* Writes the remaining data and the gzip trailer. fp is not closed. */
+    int ret = GzipWriter_compress(self, NULL, 0, Z_FINISH);
+    self->closed = 1;
+    zng_deflateEnd(&self->zst);
+    self->is_initialised = 0;
+    LEAVE_ZLIB(self);
+    if (ret < 0) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+GzipWriter_readable(GzipWriter *self, PyObject *Py_UNUSED(ignore))
+{
+    Py_RETURN_FALSE;
+}
+
+static PyObject *
+GzipWriter_writable(GzipWriter *self, PyObject *Py_UNUSED(ignore))
+{
+    Py_RETURN_TRUE;
+}
+
+static PyObject *
+GzipWriter_seekable(GzipWriter *self, PyObject *Py_UNUSED(ignore))
+{
+    Py_RETURN_FALSE;
+}
+
+static PyObject *
+GzipWriter_tell(GzipWriter *self, PyObject *Py_UNUSED(ignore))
+{
+    return PyLong_FromUnsignedLongLong(self->_size);
+}
+
+static PyObject *
+GzipWriter_get_closed(GzipWriter *self, void *Py_UNUSED(closure))
+{
+    return PyBool_FromLong(self->closed);
+}
+
+static PyMethodDef GzipWriter_methods[] = {
+    {"write", (PyCFunction)GzipWriter_write, METH_O, NULL},
+    {"flush", (PyCFunction)GzipWriter_flush, METH_VARARGS, NULL},
+    {"close", (PyCFunction)GzipWriter_close, METH_NOARGS, NULL},
+    {"readable", (PyCFunction)GzipWriter_readable, METH_NOARGS, NULL},
+    {"writable", (PyCFunction)GzipWriter_writable, METH_NOARGS, NULL},
+    {"seekable", (PyCFunction)GzipWriter_seekable, METH_NOARGS, NULL},
+    {"tell", (PyCFunction)GzipWriter_tell, METH_NOARGS, NULL},
+    {NULL},
+};
+
+static PyGetSetDef GzipWriter_properties[] = {
+    {"closed", (getter)GzipWriter_get_closed, NULL, NULL, NULL},
+    {NULL},
+};
+
+static PyTypeObject GzipWriter_Type = {
+    .tp_name = "zlib_ng._GzipWriter",
+    .tp_basicsize = sizeof(GzipWriter),
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_dealloc = (destructor)GzipWriter_dealloc,
+    .tp_new = (newfunc)(GzipWriter__new__),
+    .tp_doc = GzipWriter__new____doc__,
+    .tp_methods = GzipWriter_methods,
+    .tp_getset = GzipWriter_properties,
+};
+
+
 
 static PyMethodDef zlib_methods[] =
 {
@@ -2939,6 +3414,7 @@ static PyMethodDef zlib_methods[] =
     ZLIB_CRC32_COMBINE_METHODDEF,
     ZLIB_DECOMPRESS_METHODDEF,
     ZLIB_DECOMPRESSOBJ_METHODDEF,
+    ZLIB__GZIP_COMPRESS_METHODDEF,
     {NULL, NULL}
 };
 
@@ -3000,6 +3476,14 @@ PyInit_zlib_ng(void)
         return NULL;
     }
 
+    if (PyType_Ready(&GzipWriter_Type) != 0) {
+        return NULL;
+    }
+    Py_INCREF(&GzipWriter_Type);
+    if (PyModule_AddObject(m, "_GzipWriter", (PyObject *)&GzipWriter_Type) < 0) {
+        return NULL;
+    }
+
     if (PyType_Ready(&ParallelCompress_Type) != 0) {
         return NULL;
     }
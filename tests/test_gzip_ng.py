@@ -16,6 +16,7 @@ import re
 import shutil
 import sys
 import tempfile
+import tracemalloc
 import zlib
 from gzip import FCOMMENT, FEXTRA, FHCRC, FNAME, FTEXT  # type: ignore
 from pathlib import Path
@@ -43,6 +44,125 @@ def test_write_readonly_file():
     error.match(r"write\(\) on read-only GzipNGFile object")
 
 
+class WriteCountingBytesIO(io.BytesIO):
+    write_calls = 0
+
+    def write(self, data):
+        self.write_calls += 1
+        return super().write(data)
+
+
+def test_write_small_writes_are_buffered():
+    fileobj = WriteCountingBytesIO()
+    with gzip_ng.GzipNGFile(fileobj=fileobj, mode="wb") as test:
+        for _ in range(1000):
+            test.write(DATA)
+        assert test.tell() == 1000 * len(DATA)
+        # Nothing has been written to the underlying file yet.
+        assert fileobj.write_calls == 0
+        test.flush()
+        assert fileobj.write_calls > 0
+    assert gzip.decompress(fileobj.getvalue()) == 1000 * DATA
+
+
+def test_write_flush_writes_buffered_data():
+    fileobj = io.BytesIO()
+    with gzip_ng.GzipNGFile(fileobj=fileobj, mode="wb") as test:
+        test.write(DATA)
+        test.flush()
+        decompressor = zlib.decompressobj(wbits=31)
+        assert decompressor.decompress(fileobj.getvalue()) == DATA
+
+
+def test_writelines():
+    fileobj = io.BytesIO()
+    lines = [b"line %d\n" % i for i in range(10000)]
+    with gzip_ng.GzipNGFile(fileobj=fileobj, mode="wb") as test:
+        test.writelines(lines)
+        assert test.tell() == len(b"".join(lines))
+    assert gzip.decompress(fileobj.getvalue()) == b"".join(lines)
+
+
+def test_writelines_readonly_file():
+    with gzip_ng.GzipNGFile(TEST_FILE, "rb") as test:
+        with pytest.raises(OSError) as error:
+            test.writelines([b"bla"])
+    error.match(r"writelines\(\) on read-only GzipNGFile object")
+
+
+@pytest.mark.parametrize("level", [1, 6, 9])
+def test_write_header_same_as_gzip(level):
+    gzip_ng_out = io.BytesIO()
+    gzip_out = io.BytesIO()
+    with gzip_ng.GzipNGFile("test.txt.gz", "wb", level, gzip_ng_out,
+                            mtime=1234) as test:
+        test.write(DATA)
+    with gzip.GzipFile("test.txt.gz", "wb", level, gzip_out,
+                       mtime=1234) as test:
+        test.write(DATA)
+    header_size = len(b"\x1f\x8b\x08\x08\xd2\x04\x00\x00\x00\xfftest.txt\x00")
+    assert gzip_ng_out.getvalue()[:header_size] == \
+           gzip_out.getvalue()[:header_size]
+    assert gzip_ng_out.getvalue()[-8:] == gzip_out.getvalue()[-8:]
+
+
+def test_gzip_writer():
+    fileobj = io.BytesIO()
+    writer = zlib_ng._GzipWriter(fileobj, 1, 1234, b"test.txt")
+    assert writer.write(DATA) == len(DATA)
+    assert writer.tell() == len(DATA)
+    writer.close()
+    assert writer.closed
+    compressed = fileobj.getvalue()
+    assert compressed[4:8] == (1234).to_bytes(4, "little")
+    assert compressed[10:19] == b"test.txt\x00"
+    assert gzip.decompress(compressed) == DATA
+
+
+def test_gzip_writer_collects_output():
+    fileobj = io.BytesIO()
+    writer = zlib_ng._GzipWriter(fileobj)
+    writer.write(DATA)
+    # The header is collected in the buffer and not written yet.
+    assert fileobj.getvalue() == b""
+    writer.flush()
+    assert zlib.decompressobj(wbits=31).decompress(fileobj.getvalue()) == DATA
+
+
+def test_gzip_writer_write_closed():
+    writer = zlib_ng._GzipWriter(io.BytesIO())
+    writer.close()
+    with pytest.raises(ValueError) as error:
+        writer.write(DATA)
+    error.match("closed file")
+
+
+def test_gzip_writer_filename_with_null_byte():
+    with pytest.raises(ValueError):
+        zlib_ng._GzipWriter(io.BytesIO(), filename=b"test\x00.txt")
+
+
+def test_gzip_writer_fp_positional_only():
+    with pytest.raises(TypeError):
+        zlib_ng._GzipWriter(fp=io.BytesIO())
+
+
+def test_readinto():
+    buffer = bytearray(10)
+    with gzip_ng.GzipNGFile(fileobj=io.BytesIO(COMPRESSED_DATA)) as test:
+        assert test.readinto(buffer) == 10
+        assert buffer == DATA[:10]
+        assert test.read() == DATA[10:]
+        assert test.readinto(buffer) == 0
+
+
+def test_readinto_write_only():
+    with gzip_ng.GzipNGFile(fileobj=io.BytesIO(), mode="wb") as test:
+        with pytest.raises(OSError) as error:
+            test.readinto(bytearray(10))
+    error.match(r"readinto\(\) on write-only GzipNGFile object")
+
+
 def test_gzip_ng_reader_readall():
     data = io.BytesIO(COMPRESSED_DATA)
     test = gzip_ng._GzipNGReader(data)
@@ -254,6 +374,42 @@ def test_compress_infile_out_file_no_name(tmp_path, capsysbinary):
     assert output[4:8] == b"\x00\x00\x00\x00"  # No timestamp set.
 
 
+@pytest.mark.parametrize("threads", [1, 2, -1])
+def test_compress_infile_out_file_threads(tmp_path, capsysbinary, threads):
+    test = tmp_path / "test"
+    data = os.urandom(1024 * 1024) * 3
+    test.write_bytes(data)
+    out_file = tmp_path / "compressed.gz"
+    sys.argv = ['', f'--threads={threads}', '-o', str(out_file), str(test)]
+    gzip_ng.main()
+    out, err = capsysbinary.readouterr()
+    assert gzip.decompress(out_file.read_bytes()) == data
+    assert err == b''
+    assert out == b''
+
+
+@pytest.mark.parametrize("level", [1, 6, 9])
+def test_compress_header_same_as_gzip(level):
+    compressed = gzip_ng.compress(DATA, level, mtime=1234)
+    assert compressed[:10] == gzip.compress(DATA, level, mtime=1234)[:10]
+    assert gzip.decompress(compressed) == DATA
+
+
+@pytest.mark.parametrize("level", range(-1, 10))
+def test_compress_empty(level):
+    compressed = gzip_ng.compress(b"", level, mtime=1234)
+    # The empty result is written without zlib-ng, so compare it with what
+    # the deflate stream produces.
+    compressobj = zlib_ng.compressobj(level, wbits=31)
+    expected = compressobj.compress(b"") + compressobj.flush()
+    assert compressed[:4] == expected[:4]
+    assert compressed[4:8] == (1234).to_bytes(4, "little")
+    assert compressed[8] == expected[8]
+    assert compressed[9] == 255
+    assert compressed[10:] == expected[10:]
+    assert gzip.decompress(compressed) == b""
+
+
 def test_decompress():
     assert gzip_ng.decompress(COMPRESSED_DATA) == DATA
 
@@ -267,6 +423,31 @@ def test_decompress_concatenated_with_nulls():
     assert gzip_ng.decompress(data) == DATA + DATA
 
 
+def test_decompress_forged_isize_limits_preallocation():
+    data = gzip_ng.compress(os.urandom(100_000))
+    # Claim a decompressed size far beyond what the data could produce.
+    forged = data[:-4] + (1000 * len(data)).to_bytes(4, "little")
+    tracemalloc.start()
+    try:
+        with pytest.raises(gzip_ng.BadGzipFile):
+            gzip_ng.decompress(forged)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 100 * len(data)
+
+
+def test_decompress_ending_with_empty_member():
+    # BGZF files end with an empty member, which has an ISIZE of 0.
+    data = COMPRESSED_DATA * 2 + gzip.compress(b"")
+    assert gzip_ng.decompress(data) == DATA * 2
+
+
+def test_decompress_trailing_garbage():
+    with pytest.raises(gzip_ng.BadGzipFile):
+        gzip_ng.decompress(COMPRESSED_DATA + b"this is not gzip data")
+
+
 def test_decompress_missing_trailer():
     with pytest.raises(EOFError) as error:
         gzip_ng.decompress(COMPRESSED_DATA[:-8])
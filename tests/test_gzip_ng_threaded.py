@@ -19,35 +19,64 @@ import pytest
 from zlib_ng import gzip_ng_threaded, zlib_ng
 
 TEST_FILE = str((Path(__file__).parent / "data" / "test.fastq.gz"))
+# Random bytes are incompressible. They are only needed for that property,
+# so they are generated once.
+INCOMPRESSIBLE_DATA = os.urandom(1024 * 64)
 
 
-def test_threaded_read():
+@pytest.fixture(scope="session")
+def compressed_data():
+    return Path(TEST_FILE).read_bytes()
+
+
+@pytest.fixture(scope="session")
+def decompressed_data(compressed_data):
+    return gzip.decompress(compressed_data)
+
+
+def test_threaded_read(decompressed_data):
     with gzip_ng_threaded.open(TEST_FILE, "rb") as thread_f:
         thread_data = thread_f.read()
-    with gzip.open(TEST_FILE, "rb") as f:
-        data = f.read()
-    assert thread_data == data
+    assert thread_data == decompressed_data
+
+
+def test_threaded_read_partial_then_all(decompressed_data):
+    with gzip_ng_threaded.open(TEST_FILE, "rb", block_size=8 * 1024) as f:
+        start = f.read(1000)
+        rest = f.read()
+        assert f.tell() == len(decompressed_data)
+        assert f.read() == b""
+    assert start + rest == decompressed_data
 
 
 @pytest.mark.parametrize(["mode", "threads"],
                          itertools.product(["wb", "wt"], [1, 3, -1]))
-def test_threaded_write(mode, threads):
-    with tempfile.NamedTemporaryFile("wb", delete=False) as tmp:
-        # Use a small block size to simulate many writes.
-        with gzip_ng_threaded.open(tmp, mode, threads=threads,
-                                   block_size=8*1024) as out_file:
-            gzip_open_mode = "rb" if "b" in mode else "rt"
-            with gzip.open(TEST_FILE, gzip_open_mode) as in_file:
-                while True:
-                    block = in_file.read(128 * 1024)
-                    if not block:
-                        break
-                    out_file.write(block)
-    with gzip.open(TEST_FILE, "rt") as test_file:
-        test_data = test_file.read()
-    with gzip.open(tmp.name, "rt") as test_out:
+def test_threaded_write(mode, threads, decompressed_data):
+    sink = io.BytesIO()
+    # Use a small block size to simulate many writes.
+    with gzip_ng_threaded.open(sink, mode, threads=threads,
+                               block_size=8*1024) as out_file:
+        # Read from memory, so the reference decompression is not repeated
+        # for every parametrization.
+        if "b" in mode:
+            in_file = io.BytesIO(decompressed_data)
+            buffer = memoryview(bytearray(128 * 1024))
+            while True:
+                read_bytes = in_file.readinto(buffer)
+                if not read_bytes:
+                    break
+                out_file.write(buffer[:read_bytes])
+        else:
+            in_file = io.StringIO(decompressed_data.decode())
+            while True:
+                block = in_file.read(128 * 1024)
+                if not block:
+                    break
+                out_file.write(block)
+    sink.seek(0)
+    with gzip.open(sink, "rt") as test_out:
         out_data = test_out.read()
-    assert test_data == out_data
+    assert decompressed_data.decode() == out_data
 
 
 def test_threaded_open_no_threads():
@@ -70,10 +99,8 @@ def test_threaded_open_not_a_file_or_pathlike():
 # indefinitely.
 
 @pytest.mark.timeout(5)
-def test_threaded_read_error():
-    with open(TEST_FILE, "rb") as f:
-        data = f.read()
-    truncated_data = data[:-8]
+def test_threaded_read_error(compressed_data):
+    truncated_data = compressed_data[:-8]
     with gzip_ng_threaded.open(io.BytesIO(truncated_data), "rb") as tr_f:
         with pytest.raises(EOFError):
             tr_f.read()
@@ -82,19 +109,16 @@ def test_threaded_read_error():
 @pytest.mark.timeout(5)
 @pytest.mark.parametrize("threads", [1, 3])
 def test_threaded_write_oversized_block_no_error(threads):
-    # Random bytes are incompressible, and therefore are guaranteed to
-    # trigger a buffer overflow when larger than block size unless handled
-    # correctly.
-    data = os.urandom(1024 * 63)  # not a multiple of block_size
-    with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmp:
-        with gzip_ng_threaded.open(
-                tmp, "wb", compresslevel=3, threads=threads,
-                block_size=8 * 1024
-        ) as writer:
-            writer.write(data)
-    with gzip.open(tmp.name, "rb") as gzipped:
-        decompressed = gzipped.read()
-    assert data == decompressed
+    # Incompressible data is guaranteed to trigger a buffer overflow when
+    # larger than block size unless handled correctly.
+    data = INCOMPRESSIBLE_DATA[:1024 * 63]  # not a multiple of block_size
+    sink = io.BytesIO()
+    with gzip_ng_threaded.open(
+            sink, "wb", compresslevel=3, threads=threads,
+            block_size=8 * 1024
+    ) as writer:
+        writer.write(data)
+    assert data == gzip.decompress(sink.getvalue())
 
 
 @pytest.mark.timeout(5)
@@ -105,14 +129,14 @@ def test_threaded_write_error(threads):
         threads=threads, block_size=8 * 1024)
     # Bypass the write method which should not allow blocks larger than
     # block_size.
-    f.input_queues[0].put((os.urandom(1024 * 64), b""))
+    f.input_queues[0].put((INCOMPRESSIBLE_DATA, b""))
     with pytest.raises(OverflowError) as error:
         f.close()
     error.match("Compressed output exceeds buffer size")
 
 
-def test_close_reader():
-    tmp = io.BytesIO(Path(TEST_FILE).read_bytes())
+def test_close_reader(compressed_data):
+    tmp = io.BytesIO(compressed_data)
     f = gzip_ng_threaded._ThreadedGzipReader(tmp, "rb")
     f.close()
     assert f.closed